@@ -1,59 +1,154 @@
-import json
-import os
-import sys
-
-
-attack_type_dict = json.loads(open('./config/attack_type_dict.json', 'r', encoding="utf-8").read())
-ENV_KEY_LIST = [
-    'PROJECT_NAME', 
-    'REPORT_ONWER', 
-    'WEBDAV_HOSTNAME', 
-    'WEBDAV_LOGIN', 
-    'WEBDAV_PASSWORD',
-    'DATABASE_URL',
-    # 'EXCEPT_APP_IDS',
-    # 'EXCEPT_IPS'
-    ]
-env = {}
-for key in ENV_KEY_LIST:
-    val = os.environ.get(key)
-    if not val or val=="":
-        print(f"未设置环境变量{key}")
-        sys.exit(-1)
-    env[key.lower()] = val
-
-
-def parse_env_list(env_value, default=None):
-    """解析环境变量中的逗号分隔列表"""
-    if default is None:
-        default = []
-    
-    if not env_value:
-        return default
-    
-    # 去除首尾空格，按逗号分割，过滤空值
-    return [
-        f"'{item.strip()}'"
-        for item in str(env_value).split(',') 
-        if item.strip()
-    ]
-
-# 使用
-except_app_ids = parse_env_list(os.environ.get('EXCEPT_APP_IDS'))
-except_ips = parse_env_list(os.environ.get('EXCEPT_IPS'))
-
-config = {
-    "project_name": env.get("project_name"),
-    "report_onwer": env.get("report_onwer"),
-    "database_url": env.get("database_url"),
-    'except_app_ids': except_app_ids,
-    'except_ips': except_ips,
-    'log_level': os.environ.get('LOG_LEVEL', 'INFO').upper(),
-    "webdav_options" : {
-        "webdav_hostname": env.get("webdav_hostname"),
-        "webdav_login":    env.get("webdav_login"),
-        "webdav_password": env.get("webdav_password"),
-        "disable_check": True
-    },
-    "attack_type_dict": attack_type_dict
-}
+import logging
+import mmap
+import os
+import pickle
+import sys
+from dataclasses import dataclass
+
+# orjson解析速度远快于标准库json，未安装时回退到标准库
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+
+_attack_type_dict = None
+
+
+def _get_attack_type_dict():
+    # 延迟到首次访问才加载，import本模块不再付出解析成本
+    global _attack_type_dict
+    if _attack_type_dict is None:
+        # intern短字符串：重复串去重，后续dict查找可走指针相等的快路径
+        _attack_type_dict = {
+            sys.intern(k): (sys.intern(v) if isinstance(v, str) else v)
+            for k, v in _load_attack_type_dict().items()
+        }
+    return _attack_type_dict
+
+
+def __getattr__(name):
+    # PEP 562：保持 from config.config import 后访问attack_type_dict的兼容性
+    if name == 'attack_type_dict':
+        return _get_attack_type_dict()
+    raise AttributeError(name)
+
+
+def _load_attack_type_dict():
+    # 优先读取构建期生成的pickle缓存（见Dockerfile），启动时可完全跳过JSON解析
+    pkl_path = './config/attack_type_dict.pkl'
+    if os.path.exists(pkl_path):
+        with open(pkl_path, 'rb') as f:
+            return pickle.load(f)
+    # mmap让解析器直接读page cache，省掉read()整文件拷贝；
+    # 标准库json不接受buffer对象，只能退回read()
+    with open('./config/attack_type_dict.json', 'rb') as f:
+        if _json.__name__ == 'orjson':
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _json.loads(memoryview(mm))
+        return _json.loads(f.read())
+
+
+ENV_KEY_LIST = (
+    'PROJECT_NAME',
+    'REPORT_ONWER',
+    'WEBDAV_HOSTNAME',
+    'WEBDAV_LOGIN',
+    'WEBDAV_PASSWORD',
+    'DATABASE_URL',
+    # 'EXCEPT_APP_IDS',
+    # 'EXCEPT_IPS'
+    )
+# 一次性快照os.environ，后续按key读取走普通dict，免去每次的编码检查
+_env_snapshot = dict(os.environ)
+
+_get = _env_snapshot.get
+
+# 一次扫描找出全部缺失的环境变量并一并报出，而不是遇到第一个就退出
+missing = [key for key in ENV_KEY_LIST if not _get(key)]
+if missing:
+    print(f"未设置环境变量: {','.join(missing)}")
+    sys.exit(-1)
+env = {key.lower(): _env_snapshot[key] for key in ENV_KEY_LIST}
+
+
+def parse_env_list(env_value, default=None):
+    """解析环境变量中的逗号分隔列表"""
+    if default is None:
+        default = []
+    
+    if not env_value:
+        return default
+
+    # 去除首尾空格，按逗号分割，过滤空值（单遍扫描，strip只做一次）
+    # 环境变量取出来必然是str，无需再str()转换
+    # 只存原始值，SQL引号由构建SQL的一侧负责
+    result = []
+    for item in env_value.split(','):
+        item = item.strip()
+        if item:
+            result.append(item)
+    return result
+
+# 使用
+except_app_ids = parse_env_list(_env_snapshot.get('EXCEPT_APP_IDS'))
+except_ips = parse_env_list(_env_snapshot.get('EXCEPT_IPS'))
+
+# 配置在import后只读，冻结的__slots__ dataclass把每次dict哈希查找
+# 换成属性槽位访问，误写会直接报错
+# （镜像还是python3.9，没有dataclass(slots=True)，手写__slots__）
+@dataclass(frozen=True)
+class WebdavOptions:
+    __slots__ = ('webdav_hostname', 'webdav_login', 'webdav_password', 'disable_check')
+    webdav_hostname: str
+    webdav_login: str
+    webdav_password: str
+    disable_check: bool
+
+    def as_options(self):
+        """webdav3.Client只接受dict形式的选项"""
+        return {
+            "webdav_hostname": self.webdav_hostname,
+            "webdav_login": self.webdav_login,
+            "webdav_password": self.webdav_password,
+            "disable_check": self.disable_check,
+        }
+
+
+@dataclass(frozen=True)
+class Config:
+    __slots__ = ('project_name', 'report_onwer', 'database_url',
+                 'except_app_ids', 'except_ips', 'log_level', 'webdav_options')
+    project_name: str
+    report_onwer: str
+    database_url: str
+    except_app_ids: list
+    except_ips: list
+    log_level: int
+    webdav_options: WebdavOptions
+
+    @property
+    def attack_type_dict(self):
+        # 延迟加载，见_get_attack_type_dict
+        return _get_attack_type_dict()
+
+
+# 日志等级在这里一次性翻译成int常量，logger.setLevel不用再做名称查表
+_log_level = logging.getLevelName(_env_snapshot.get('LOG_LEVEL', 'INFO').upper())
+if not isinstance(_log_level, int):
+    _log_level = logging.INFO
+
+config = Config(
+    project_name=env.get("project_name"),
+    report_onwer=env.get("report_onwer"),
+    database_url=env.get("database_url"),
+    except_app_ids=except_app_ids,
+    except_ips=except_ips,
+    log_level=_log_level,
+    webdav_options=WebdavOptions(
+        webdav_hostname=env.get("webdav_hostname"),
+        webdav_login=env.get("webdav_login"),
+        webdav_password=env.get("webdav_password"),
+        disable_check=True,
+    ),
+)
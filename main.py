@@ -1,513 +1,809 @@
-from docx import Document
-import psycopg2
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-import matplotlib.font_manager as fm
-import datetime
-import time
-import os
-import sys
-from config.config import config
-from webdav3.client import Client
-import schedule
-import logging
-import logging.handlers
-from docx.shared import Pt, RGBColor, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-
-
-today = datetime.date.today()
-start_day = today-datetime.timedelta(days=7)
-
-start_time = int(time.mktime(start_day.timetuple()))
-end_time = int(time.mktime(today.timetuple())) - 1
-end_day = str(datetime.datetime.fromtimestamp(end_time))[:10]
-
-
-
-def __render_table_with_data(doc, columns, rows):
-    table = doc.add_table(1, len(columns))
-    table.style = 'Table Grid'
-    # table.style = 'Table Normal'
-    hd_cells = table.rows[0].cells
-    for i in range(len(columns)):
-        hd_cells[i].text = str(columns[i])
-    for row in rows:
-        cells = table.add_row().cells
-        for j in range(len(row)):
-            cells[j].text = str(row[j])
-
-
-def __query_data_from_db(cursor, sql):
-    try:
-        logger.debug(sql)
-        cursor.execute(sql)
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        cursor.close()
-        return columns, rows
-    except Exception as e:
-        logger.error(e)
-        logger.error("查询数据时失败")
-        return None
-    
-
-
-def __get_attack_type_name(rows, index):
-    row_list = []
-    for row in rows:
-        row = list(row)
-        row[index] = config.get("attack_type_dict").get(f'attack.type.{row[index]}', "未知攻击类型")
-        row_list.append(row)
-    return row_list
-
-
-def get_total(doc, conn):
-    sql = f"""
-        select
-            coalesce(sum(case when mss."type" = 'website-req' then mss.value end)::int, 0) as 访问总数,
-            coalesce(sum(case when mss."type" = 'website-denied' then mss.value end)::int, 0) as 拦截总数,
-            (
-            select
-                count(*) as 黑名单拦截数
-            from
-                mgt_rule_detect_log_basic mrdlb
-            where
-                mrdlb.attack_type =-3
-                and mrdlb."timestamp" >= {start_time}
-                and mrdlb."timestamp" <= {end_time}
-                {f"and mrdlb.site_uuid not in({','.join(config.get('except_app_ids', []))})" if len(config.get('except_app_ids', []))>0 else ''}
-                ),
-            (
-            select
-                count(*) as 未拦截数
-            from
-                mgt_detect_log_basic mdlb
-            where
-                mdlb."action" = 0
-                and mdlb."timestamp" >= {start_time}
-                and mdlb."timestamp" <= {end_time}
-                {f"and mdlb.site_uuid not in ({','.join(config.get('except_app_ids', []))})" if len(config.get('except_app_ids', []))>0 else ''}
-                )
-        from
-            mgt_system_statistics mss
-        where
-            mss.created_at >= '{start_day}'
-            and
-        mss.created_at <= '{end_day}'
-        {f"and mss.website not in ({','.join(config.get('except_app_ids', []))})" if len(config.get('except_app_ids', []))>0 else ''}
-        """
-    
-    columns, rows = __query_data_from_db(conn.cursor(), sql)
-    return [dict(zip(columns, row)) for row in rows][0]
-
-def get_defens_apps(doc, conn):
-    sql = f"""
-        select
-            mw.id as 应用序号,
-            mw."comment" as 应用名称,
-            mw.server_names as 域名,
-            mw.ports as 开放端口,
-            coalesce(SUM(case when mss."type" = 'website-req' then mss.value end)::int,
-            0) as 请求次数,
-            coalesce(SUM(case when mss."type" = 'website-denied' then mss.value end)::int,
-            0) as 拦截次数
-        from
-            mgt_website mw
-        left join mgt_system_statistics mss on
-            mw.id = mss.website::bigint
-            and mss.created_at >= '{start_day}'
-            and mss.created_at <= '{end_day}'
-            {f"where mw.id not in ({','.join(config.get('except_app_ids', []))})" if len(config.get('except_app_ids', []))>0 else ''}
-        group by
-            mw.id,
-            mw."comment",
-            mw.server_names,
-            mw.ports
-        order by
-            mw.id;
-            """
-    columns, rows = __query_data_from_db(conn.cursor(), sql)
-    if len(rows) <= 0:
-        doc.add_paragraph(f"暂无防护应用。", style='ReportBodyText')
-    else:
-        __render_table_with_data(doc, columns, rows)
-
-
-def get_access_total_by_geos(doc, conn):
-    sql = f"""
-        select
-            country as 国家代号,
-            province as 省份,
-            city as 城市,
-            sum(count) as 访问次数
-        from
-            statistics_geos sg
-        where
-            "time" >= {start_time}
-            and "time" <= {end_time}
-        group by
-            country,
-            province,
-            city
-        order by
-            访问次数 desc,
-            country,
-            province,
-            city
-        """
-    columns, rows = __query_data_from_db(conn.cursor(), sql)
-    if len(rows) <= 0:
-        doc.add_paragraph(f"本周暂无访问数据。", style='ReportBodyText')
-    else:
-        custom_add_paragraph(doc, f"本周访问数据主要来自:p{rows[0][1]}:sMyEmphasis:p-:p{rows[0][2]}:sMyEmphasis:p，访问次数为:p{rows[0][3]}:sMyEmphasis:p，具体数据可参看下表。")
-        __render_table_with_data(doc, columns, rows)
-
-
-def get_access_total_by_ips(doc, conn):
-    sql = f"""
-        select 
-        si."key" as 访问ip,
-        si.attack_type as 访问类型,
-        sum(si.count) as 访问次数
-        from
-        statistics_ips si
-        where 
-        si."time" >= {start_time}
-            and 
-        si."time" <= {end_time}
-            and 
-        si.attack_type = -1
-        {f"and si.key not in ({','.join(config.get('except_ips', []))})" if len(config.get('except_ips', [])) > 0 else ''}
-        group by si."key",si.attack_type
-        order by 访问次数 desc,si.key
-        limit 10
-        """
-    columns, rows = __query_data_from_db(conn.cursor(), sql)
-    if len(rows) <= 0:
-        doc.add_paragraph(f"本周暂无访问数据。", style='ReportBodyText')
-    else:
-        rows = __get_attack_type_name(rows, 1)
-        custom_add_paragraph(doc, f"本周主要访问IP为:p{rows[0][0]}:sMyEmphasis:p，访问次数为:p{rows[0][2]}:sMyEmphasis:p，具体数据可参看下表。")
-        __render_table_with_data(doc, columns, rows)
-
-
-def get_attack_total_by_ips(doc,conn):
-    sql = f"""
-        select 
-        si."key" as 访问ip,
-        si.attack_type as 攻击类型,
-        sum(si.count) as 攻击次数
-        from
-        statistics_ips si
-        where 
-        si."time" >= {start_time}
-            and 
-        si."time" <= {end_time}
-            and
-        si.attack_type > 0
-        {f"and si.key not in ({','.join(config.get('except_ips', []))})" if len(config.get('except_ips', [])) > 0 else ''}
-        group by si."key",si.attack_type
-        order by 攻击次数 desc,si.key
-        limit 10
-        """
-    columns, rows = __query_data_from_db(conn.cursor(), sql)
-    if len(rows)<=0:
-        doc.add_paragraph("本周暂无攻击数据，您的waf很安全", style='ReportBodyText')
-    else:
-        rows = __get_attack_type_name(rows, 1)
-        custom_add_paragraph(doc, f"本周的攻击主要来自:p{rows[0][0]}:sMyEmphasis:p，攻击类型为:p{rows[0][1]}:sMyEmphasis:p，总计攻击:p{rows[0][2]}:sMyEmphasis:p次，具体数据参看下表。")
-        __render_table_with_data(doc, columns, rows)
-
-
-def get_attack_total_by_type(doc,conn):
-    sql = f"""
-        select 
-        si.attack_type as 攻击类型,
-        sum(si.count)::int as 攻击次数
-        from
-        statistics_ips si
-        where 
-        si."time" >= {start_time}
-            and 
-        si."time" <= {end_time}
-            and
-        si.attack_type > 0 
-        {f"and si.key not in ({','.join(config.get('except_ips', []))})" if len(config.get('except_ips', [])) > 0 else ''}
-        group by si.attack_type
-        order by 攻击次数 desc
-        """
-    columns, rows = __query_data_from_db(conn.cursor(), sql)
-    if len(rows)<=0:
-        doc.add_paragraph("本周暂无攻击数据，您的waf很安全", style='ReportBodyText')
-    else:
-        rows = __get_attack_type_name(rows, 0)
-
-        trans_rows = np.transpose(rows)
-        explode = [0.01] * len(trans_rows[0])
-        explode[0] = 0.1
-        plt.figure(dpi=300)
-        plt.pie(trans_rows[1],
-            labels=trans_rows[0], # 设置饼图标签
-            explode=explode, # 第二部分突出显示，值越大，距离中心越远
-            autopct='%.2f%%', # 格式化输出百分比
-        )
-        plt.title("攻击类型统计图")
-        plt.savefig("./攻击类型统计图.png")
-        p = custom_add_paragraph(doc, f"本周的主要攻击类型为:p{trans_rows[0][0]}:sMyEmphasis:p，该类型总计攻击:p{trans_rows[1][0]}:sMyEmphasis:p次，具体数据如下图表所示。")
-        run = p.add_run()
-        run.add_picture("./攻击类型统计图.png")
-        __render_table_with_data(doc, columns, rows)
-
-
-
-def get_not_defens_log(doc,conn):
-    sql = f"""
-    select 
-    mw."comment" as 被攻击应用,
-    mdlb.src_ip as 源IP,
-    mdlb.host as 目标主机,
-    mdlb.url_path as 请求路径,
-    mdlb.dst_port as 目标端口,
-    mdlb.country as 国家代码,
-    mdlb.province as 省份,
-    mdlb.city as 城市,
-    mdlb.attack_type as 攻击类型,
-    mdlb.updated_at as 攻击时间
-    from 
-    mgt_detect_log_basic mdlb,
-    mgt_website mw
-    where
-    mdlb.site_uuid::int = mw.id::int
-    and
-    mdlb."timestamp" >= {start_time}
-    and
-    mdlb."timestamp" <= {end_time}
-    and
-    mdlb."action" = 0
-    {f"and mdlb.site_uuid not in ({','.join(config.get('except_app_ids', []))})" if len(config.get('except_app_ids', []))>0 else ''}
-    """
-    columns, rows = __query_data_from_db(conn.cursor(), sql)
-    if len(rows) <= 0:
-        doc.add_paragraph("本周暂无未拦截攻击，所有攻击都被拒之门外。", style='ReportBodyText')
-    else:
-        # doc.add_paragraph(f"本周攻击有{len(rows)}条攻击未被拦截，我们将对其进行分析和拦截处理，具体数据参看下表。")
-        custom_add_paragraph(doc, f"本周攻击有:p{len(rows)}:sMyEmphasis:p条攻击未被拦截，我们将对其进行分析和拦截处理，具体数据参看下表。")
-        rows = __get_attack_type_name(rows, 8)
-        __render_table_with_data(doc, columns, rows)
-
-def init_doc():
-    doc = Document()
-    styles = doc.styles
-
-    H1 = styles['Heading 1']
-    H1.font.name = '微软雅黑'
-    H1.font.color.rgb = RGBColor(79, 128, 189)
-
-    H2 = styles['Heading 2']
-    H2.font.name = '微软雅黑'
-    H1.font.color.rgb = RGBColor(79, 128, 189)
-
-    if 'ReportHeading1' not in styles:
-        heading_style = styles.add_style('ReportHeading1', 1)
-        heading_style.font.name = '黑体'
-        heading_style.font.size = Pt(16)
-        heading_style.font.bold = True
-        heading_style.font.color.rgb = RGBColor(0, 0, 139)
-        heading_style.paragraph_format.space_before = Pt(12)
-        heading_style.paragraph_format.space_after = Pt(6)
-
-    if 'ReportHeading2' not in styles:
-        heading_style = styles.add_style('ReportHeading2', 1)
-        heading_style.font.name = '黑体'
-        heading_style.font.size = Pt(13)
-        heading_style.font.bold = True
-        heading_style.font.color.rgb = RGBColor(0, 0, 100)
-        heading_style.paragraph_format.space_before = Pt(12)
-        heading_style.paragraph_format.space_after = Pt(6)
-
-    if 'ReportBodyText' not in styles:
-        body_style = styles.add_style('ReportBodyText', 1)
-        body_style.font.name = '宋体'
-        body_style.font.size = Pt(10.5)
-        body_style.paragraph_format.line_spacing = 1.2
-        body_style.paragraph_format.first_line_indent = Pt(21)  # 首行缩进2字符
-    
-    # 预设强调样式（字符样式）
-    if 'MyEmphasis' not in styles:
-        emph_style = styles.add_style('MyEmphasis', 2)  # 2=字符样式
-        emph_style.font.name = '楷体'
-        emph_style.font.italic = True
-        emph_style.font.color.rgb = RGBColor(178, 34, 34)
-    return doc
-
-
-def __render_paragraph(paragraph, texts):
-    for text in texts:
-        run = paragraph.add_run(str(text['value']))
-        try:
-            run.style = text['style']
-        except Exception as e:
-            pass
-            # logger.error("无style值")
-
-def __render_paragraph_by_template(paragraph, tpl):
-    tpl = str(tpl)
-    seq = tpl.split(":p")
-    for p in seq:
-        s = p.split(":s")
-        run = paragraph.add_run(str(s[0]))
-        # logger.debug(s)
-        try:
-            run.style=s[1]
-        except Exception as e:
-            # logger.error(e)
-            # logger.debug("无style")
-            pass
-
-def custom_add_paragraph(doc, tpl):
-    par = doc.add_paragraph("",style='ReportBodyText')
-    __render_paragraph_by_template(par, tpl)
-    return par
-
-
-def main():
-    logger.info(f"任务触发")
-    if not os.path.exists('./report'):
-        os.mkdir('./report')
-    logger.debug(f"数据库连接信息：{config['database_url']}")
-    conn = psycopg2.connect(config['database_url'])
-    try:
-        # doc = Document()
-        doc = init_doc()
-        # doc.add_heading(f"{config['project_name']}网络安全巡检报告")
-        doc.add_heading("一、巡检必要性概述", level=1)
-        doc.add_paragraph("本周对Web应用防火墙（WAF）进行了系统性巡检，旨在及时发现并处置潜在的安全威胁，确保Web应用服务的持续可用性和数据安全性。通过定期巡检，可有效识别异常攻击流量、优化防护策略、验证防护效果，并为安全态势评估提供数据支撑，降低因Web应用漏洞导致的数据泄露和服务中断风险。",style='ReportBodyText')
-        doc.add_heading("二、防护应用概览", level=1)
-        data = get_total(doc, conn)
-        if data['未拦截数'] == 0:
-            p = 100
-        else:
-            p = format(data['拦截总数']/(data['拦截总数']+data['未拦截数'])*100, '.2f')
-        # doc.add_paragraph(f"本周waf总体运行平稳，总访问次数为{data['访问总数']}，总拦截次数为{data['拦截总数']}，黑名单拦截次数为{data['黑名单拦截数']}，未拦截攻击次数为{data['未拦截数']}，拦截率为{p}%。")
-        template_p = f"本周waf总体运行平稳，总访问次数为:p{data['访问总数']}:sMyEmphasis:p，总拦截次数为:p{data['拦截总数']}:sMyEmphasis:p，黑名单拦截次数为:p{data['黑名单拦截数']}:sMyEmphasis:p，未拦截攻击次数为:p{data['未拦截数']}:sMyEmphasis:p，拦截率为:p{p}:sMyEmphasis:p %。"
-        custom_add_paragraph(doc, template_p)
-        doc.add_heading("2.1 分应用查看", level=2)
-        get_defens_apps(doc, conn)
-        doc.add_heading("三、访问数据统计", level=1)
-        doc.add_heading("3.1 按地理区域统计访问数据", level=2)
-        get_access_total_by_geos(doc, conn)
-        doc.add_heading("3.2 按访问IP统计访问数据TOP10", level=2)
-        get_access_total_by_ips(doc, conn)
-        doc.add_heading("四、攻击数据统计", level=1)
-        doc.add_heading("4.1 按攻击方式统计数据", level=2)
-        get_attack_total_by_type(doc, conn)
-        doc.add_heading("4.2 按攻击IP统计访问数据TOP10", level=2)
-        get_attack_total_by_ips(doc, conn)
-        doc.add_heading("五、明细数据展示", level=1)
-        doc.add_heading("5.1 未拦截攻击明细", level=2)
-        get_not_defens_log(doc, conn)
-
-        doc.add_heading("六、报告信息", level=1)
-        doc.add_paragraph(f"项目名称：{config['project_name']}")
-        doc.add_paragraph(f"报告数据统计周期：{start_day}至{end_day}")
-        doc.add_paragraph(f"报告生成时间：{datetime.datetime.now()}")
-        doc.add_paragraph(f"报告审核人：{config['report_onwer']}")
-        
-
-        conn.close()
-        doc_filename = f"{config['project_name']}_{start_day}至{end_day}安全运维周报.docx"
-        local_file_path = f'./report/{doc_filename}'
-        doc.save(local_file_path)
-    except Exception as e:
-        logger.error(e)
-        logger.error("生成报告失败")
-
-
-    try:
-        if os.path.exists(local_file_path):
-            client = Client(config.get("webdav_options"))
-            remote_base_path = f'report/{config.get("report_onwer")}'
-            client.mkdir(remote_base_path)
-            remote_base_path = f'report/{config.get("report_onwer")}/{str(today).replace("-", "")}'
-            client.mkdir(remote_base_path)
-            remote_file_path = f'{remote_base_path}/{doc_filename}'
-            client.upload_sync(remote_path=remote_file_path, local_path=local_file_path)
-        else:
-            logger.error("本地文件不存在，上传失败")
-        logger.info(f"任务结束")
-    except Exception as e:
-        logger.error(e)
-        logger.error("上传文件失败")
-
-
-
-
-def get_logger(name):
-    if not os.path.exists('./logs'):
-        os.mkdir('./logs')
-    logger = logging.getLogger(name)
-    logger.setLevel(config.get('log_level'))
-    
-    # 如果已经配置过，直接返回
-    if logger.handlers:
-        return logger
-    
-    # 设置格式
-    formatter = logging.Formatter(
-        '%(asctime)s [%(levelname)s] %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    # 输出到文件（自动切割）
-    file_handler = logging.handlers.RotatingFileHandler(
-        './logs/app.log',
-        maxBytes=10*10*1024*1024,  # 100MB
-        backupCount=5,
-        encoding='utf-8'
-    )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
-    # 输出到控制台
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    return logger
-
-
-if __name__ == '__main__':
-    logger = get_logger(__name__)
-    WQY_FONT_PATH = '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc'
-    
-    if os.path.exists(WQY_FONT_PATH):
-        matplotlib.rcParams['font.sans-serif'] = ['WenQuanYi Micro Hei']
-        matplotlib.rcParams['axes.unicode_minus'] = False
-        logger.info("字体加载OK")
-    else:
-        matplotlib.rcParams['font.sans-serif'] = ['DejaVu Sans']
-        matplotlib.rcParams['axes.unicode_minus'] = False
-        logger.debug("使用回退字体: DejaVu Sans")
-
-    if len(sys.argv) == 2 and sys.argv[1] == '-now':
-        logger.debug("立即执行生成报告")
-        main()
-        sys.exit(0)
-    
-    schedule.every().day.at("12:00").do(main)
-
-    while True:
-        logger.info(f"检测定时任务")
-        
-        today = datetime.date.today()
-        start_day = today-datetime.timedelta(days=7)
-
-        logger.debug(f"{start_day}-{end_day}")
-
-        start_time = int(time.mktime(start_day.timetuple()))
-        end_time = int(time.mktime(today.timetuple())) - 1
-        end_day = str(datetime.datetime.fromtimestamp(end_time))[:10]
-        schedule.run_pending()
-        time.sleep(3)
\ No newline at end of file
+from docx import Document
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 纯离屏渲染，跳过GUI后端探测
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import concurrent.futures
+import datetime
+import copy
+import functools
+import io
+import atexit
+import queue
+import time
+import os
+import sys
+from config.config import config
+from webdav3.client import Client
+import logging
+import logging.handlers
+from docx.shared import Pt, RGBColor, Inches
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+
+def __day_start_ts(day):
+    # 当天零点的epoch秒。datetime.timestamp()直达，
+    # 免去time.mktime的struct_tm往返（后者还依赖locale时区表现）
+    return int(datetime.datetime.combine(day, datetime.time.min).timestamp())
+
+
+today = datetime.date.today()
+start_day = today-datetime.timedelta(days=7)
+
+start_time = __day_start_ts(start_day)
+end_time = __day_start_ts(today) - 1
+end_day = str(datetime.datetime.fromtimestamp(end_time))[:10]
+
+
+
+WQY_FONT_PATH = '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc'
+
+
+@functools.lru_cache(maxsize=None)
+def __resolve_chinese_font():
+    # 字体探测只做一次，调度器每次出报告不再重复stat字体路径
+    if os.path.exists(WQY_FONT_PATH):
+        return 'WenQuanYi Micro Hei'
+    return None
+
+
+def __setup_matplotlib_font():
+    font_name = __resolve_chinese_font()
+    matplotlib.rcParams['font.sans-serif'] = [font_name or 'DejaVu Sans']
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    return font_name
+
+
+_db_pool = None
+
+
+def __get_db_pool():
+    # 连接池跨调度周期保持socket，省掉每次报告的TCP+认证握手
+    global _db_pool
+    if _db_pool is None:
+        # maxconn=5：并行取数的4个worker各借一条，外加未拦截明细
+        # 的流式游标独占一条（ThreadedConnectionPool耗尽时直接抛错，不排队）
+        # application_name让这批查询在pg_stat_activity里可按来源辨认；
+        # 连接在两次调度间要闲置近一天，开TCP keepalive防NAT/防火墙静默掐线
+        _db_pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn=1, maxconn=5, dsn=config.database_url,
+            application_name='safeline-report',
+            keepalives=1, keepalives_idle=60,
+            keepalives_interval=10, keepalives_count=3)
+    return _db_pool
+
+
+def __getconn_checked(pool):
+    # keepalive之外再验活：借出前SELECT 1，闲置期间死掉的连接
+    # 就地关闭换新的重试，而不是把断线留给第一条业务查询去撞
+    for _ in range(pool.maxconn):
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute('select 1')
+            conn.rollback()
+            return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            logger.warning("池内连接已失效，重建后重试")
+            pool.putconn(conn, close=True)
+    return pool.getconn()
+
+
+def __append_table_row(tbl, values):
+    # 直接拼<w:tr>挂到<w:tbl>上，绕开add_row()逐行重建lxml树的O(N²)开销
+    tr = OxmlElement('w:tr')
+    for value in values:
+        tc = OxmlElement('w:tc')
+        p = OxmlElement('w:p')
+        r = OxmlElement('w:r')
+        t = OxmlElement('w:t')
+        t.set(qn('xml:space'), 'preserve')
+        t.text = str(value)
+        r.append(t)
+        p.append(r)
+        tc.append(p)
+        tr.append(tc)
+    tbl.append(tr)
+
+
+def __render_table_with_data(doc, columns, rows):
+    table = doc.add_table(1, len(columns))
+    table.style = 'Table Grid'
+    # table.style = 'Table Normal'
+    hd_cells = table.rows[0].cells
+    for i in range(len(columns)):
+        hd_cells[i].text = str(columns[i])
+    tbl = table._tbl
+    for row in rows:
+        __append_table_row(tbl, row)
+
+
+def __build_not_in_clause(field, values, keyword='and', param='except_app_ids'):
+    # 排除列表走命名参数绑定：SQL文本与取值无关，服务端可以复用同一份执行计划，
+    # 也杜绝了拼接注入。取值统一由__report_params()在执行时提供
+    if len(values) <= 0:
+        return ''
+    return f"{keyword} {field} <> ALL(%({param})s)"
+
+
+def __query_data_from_db(cursor, sql, params=None):
+    # with保证异常路径上游标同样被关闭，不再带着未释放的游标归还连接
+    try:
+        with cursor:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(sql)
+            cursor.execute(sql, params or None)
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall()
+        return columns, rows
+    except Exception:
+        # exception()自带当前异常栈，不必再手动格式化
+        logger.exception("查询数据时失败")
+        return None
+
+
+def __query_one_from_db(cursor, sql, params=None):
+    # 单行结果直接fetchone；配合RealDictCursor由驱动产出dict，
+    # 不再fetchall整个结果集后zip列名
+    try:
+        with cursor:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(sql)
+            cursor.execute(sql, params or None)
+            row = cursor.fetchone()
+        return row
+    except Exception:
+        logger.exception("查询数据时失败")
+        return None
+
+
+def __query_stream_from_db(cursor, sql, params=None, itersize=1000):
+    # 服务端游标流式取数：结果不整体载入内存，峰值只与itersize成正比
+    try:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(sql)
+        cursor.itersize = itersize
+        cursor.execute(sql, params or None)
+        return cursor
+    except Exception:
+        # 流式查询成功时游标交给渲染方关闭；失败时就地收掉
+        logger.exception("查询数据时失败")
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        return None
+
+
+
+@functools.lru_cache(maxsize=None)
+def __attack_type_values():
+    # 由attack_type_dict生成 (VALUES ...) 查表SQL，
+    # 攻击类型编号→名称的翻译下推到SQL里做，Python侧不再逐行转换。
+    # 字典随镜像打包、内容可信，名称直接内联为字面量：
+    # SQL文本因此完全静态（psycopg2不允许%s与%(name)s混用）
+    items = []
+    for key, name in config.attack_type_dict.items():
+        try:
+            items.append((int(key.rsplit('.', 1)[1]), str(name).replace("'", "''")))
+        except (IndexError, ValueError):
+            continue
+    rows = ",".join(f"({code},'{name}')" for code, name in items)
+    return f"(values {rows}) as at(code, name)"
+
+
+# 排除列表在import后只读，提前物化成模块常量，
+# 每次组参数不再重新拷贝config里的列表
+_EXCEPT_APP_IDS = list(config.except_app_ids)
+_EXCEPT_IPS = list(config.except_ips)
+
+
+def __report_params():
+    # 各查询共用的一份命名参数。SQL文本由各builder缓存成常量，
+    # 每次执行只换这里的取值，服务端得以按同一份语句文本复用执行计划
+    return {
+        'start_day': str(start_day),
+        'end_day': end_day,
+        'start_time': start_time,
+        'end_time': end_time,
+        'except_app_ids': _EXCEPT_APP_IDS,
+        'except_ips': _EXCEPT_IPS,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def __total_sql():
+    exc_mrdlb = __build_not_in_clause('mrdlb.site_uuid', config.except_app_ids)
+    exc_mdlb = __build_not_in_clause('mdlb.site_uuid', config.except_app_ids)
+    exc_mss = __build_not_in_clause('mss.website', config.except_app_ids)
+    # 三张表各自聚合一次再笛卡尔拼成单行，不再把统计塞进相关子查询
+    return f"""
+        with s as (
+        select
+            coalesce(sum(case when mss."type" = 'website-req' then mss.value end)::int, 0) as 访问总数,
+            coalesce(sum(case when mss."type" = 'website-denied' then mss.value end)::int, 0) as 拦截总数
+        from
+            mgt_system_statistics mss
+        where
+            mss.created_at >= %(start_day)s
+            and mss.created_at <= %(end_day)s
+            {exc_mss}
+        ), r as (
+        select
+            count(*) as 黑名单拦截数
+        from
+            mgt_rule_detect_log_basic mrdlb
+        where
+            mrdlb.attack_type =-3
+            and mrdlb."timestamp" >= %(start_time)s
+            and mrdlb."timestamp" <= %(end_time)s
+            {exc_mrdlb}
+        ), d as (
+        select
+            count(*) as 未拦截数
+        from
+            mgt_detect_log_basic mdlb
+        where
+            mdlb."action" = 0
+            and mdlb."timestamp" >= %(start_time)s
+            and mdlb."timestamp" <= %(end_time)s
+            {exc_mdlb}
+        )
+        select s.访问总数, s.拦截总数, r.黑名单拦截数, d.未拦截数
+        from s, r, d
+        """
+
+
+def fetch_total(conn):
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    return __query_one_from_db(cursor, __total_sql(), __report_params())
+
+
+@functools.lru_cache(maxsize=None)
+def __defens_apps_sql():
+    # 排除参数是str列表，psycopg2绑定成text[]；mw.id是bigint，
+    # 比较前转成text，避免bigint <> text的类型错
+    exc_apps = __build_not_in_clause('mw.id::text', config.except_app_ids, keyword='where')
+    return f"""
+        select
+            mw.id as 应用序号,
+            mw."comment" as 应用名称,
+            mw.server_names as 域名,
+            mw.ports as 开放端口,
+            coalesce(SUM(case when mss."type" = 'website-req' then mss.value end)::int,
+            0) as 请求次数,
+            coalesce(SUM(case when mss."type" = 'website-denied' then mss.value end)::int,
+            0) as 拦截次数
+        from
+            mgt_website mw
+        left join mgt_system_statistics mss on
+            mw.id = mss.website::bigint
+            and mss.created_at >= %(start_day)s
+            and mss.created_at <= %(end_day)s
+            {exc_apps}
+        group by
+            mw.id,
+            mw."comment",
+            mw.server_names,
+            mw.ports
+        order by
+            mw.id;
+            """
+
+
+def fetch_defens_apps(conn):
+    return __query_data_from_db(conn.cursor(), __defens_apps_sql(), __report_params())
+
+
+def render_defens_apps(doc, data):
+    columns, rows = data
+    if len(rows) <= 0:
+        doc.add_paragraph(f"暂无防护应用。", style='ReportBodyText')
+    else:
+        __render_table_with_data(doc, columns, rows)
+
+
+@functools.lru_cache(maxsize=None)
+def __access_geos_sql():
+    return """
+        select
+            country as 国家代号,
+            province as 省份,
+            city as 城市,
+            sum(count) as 访问次数
+        from
+            statistics_geos sg
+        where
+            "time" >= %(start_time)s
+            and "time" <= %(end_time)s
+        group by
+            country,
+            province,
+            city
+        order by
+            访问次数 desc,
+            country,
+            province,
+            city
+        """
+
+
+def fetch_access_total_by_geos(conn):
+    return __query_data_from_db(conn.cursor(), __access_geos_sql(), __report_params())
+
+
+def render_access_total_by_geos(doc, data):
+    columns, rows = data
+    if len(rows) <= 0:
+        doc.add_paragraph(f"本周暂无访问数据。", style='ReportBodyText')
+    else:
+        custom_add_paragraph(doc, f"本周访问数据主要来自:p{rows[0][1]}:sMyEmphasis:p-:p{rows[0][2]}:sMyEmphasis:p，访问次数为:p{rows[0][3]}:sMyEmphasis:p，具体数据可参看下表。")
+        __render_table_with_data(doc, columns, rows)
+
+
+@functools.lru_cache(maxsize=None)
+def __statistics_ips_sql():
+    # statistics_ips是最大的统计表，访问IP、攻击IP、攻击类型三个口径
+    # 只差attack_type的取值范围：时间窗过滤收进CTE只扫一遍，
+    # 三路聚合打上bucket标签UNION ALL一次取回，TOP10交给窗口函数标号
+    exc_ips = __build_not_in_clause('si.key', config.except_ips, param='except_ips')
+    return f"""
+        with f as (
+        select si."key", si.attack_type, si.count
+        from statistics_ips si
+        where
+        si."time" >= %(start_time)s
+            and
+        si."time" <= %(end_time)s
+        {exc_ips}
+        ), b as (
+        select 'access_ips' as bucket, f."key" as ip, f.attack_type, sum(f.count) as cnt
+        from f where f.attack_type = -1 group by f."key", f.attack_type
+        union all
+        select 'attack_ips', f."key", f.attack_type, sum(f.count)
+        from f where f.attack_type > 0 group by f."key", f.attack_type
+        union all
+        select 'attack_type', null, f.attack_type, sum(f.count)
+        from f where f.attack_type > 0 group by f.attack_type
+        )
+        select t.bucket, t.ip, t.type_name, t.cnt, t.rn
+        from (
+        select
+        b.bucket, b.ip, coalesce(at.name, '未知攻击类型') as type_name, b.cnt::int as cnt,
+        row_number() over (partition by b.bucket order by b.cnt desc, b.ip) as rn
+        from b
+        left join {__attack_type_values()} on at.code = b.attack_type
+        ) t
+        where t.rn <= 10 or t.bucket = 'attack_type'
+        order by t.bucket, t.rn
+        """
+
+
+def fetch_statistics_ips(conn):
+    # 一次查询取回三个口径，Python侧按bucket拆成与原来同构的(columns, rows)
+    result = __query_data_from_db(conn.cursor(), __statistics_ips_sql(), __report_params())
+    if result is None:
+        return None, None, None
+    access_ips = ('访问ip', '访问类型', '访问次数'), []
+    attack_ips = ('访问ip', '攻击类型', '攻击次数'), []
+    attack_types = ('攻击类型', '攻击次数'), []
+    # TOP10已在SQL侧按rn过滤，这里只负责按bucket分拣
+    for bucket, ip, type_name, cnt, rn in result[1]:
+        if bucket == 'access_ips':
+            access_ips[1].append((ip, type_name, cnt))
+        elif bucket == 'attack_ips':
+            attack_ips[1].append((ip, type_name, cnt))
+        else:
+            attack_types[1].append((type_name, cnt))
+    return access_ips, attack_ips, attack_types
+
+
+def render_access_total_by_ips(doc, data):
+    columns, rows = data
+    if len(rows) <= 0:
+        doc.add_paragraph(f"本周暂无访问数据。", style='ReportBodyText')
+    else:
+        custom_add_paragraph(doc, f"本周主要访问IP为:p{rows[0][0]}:sMyEmphasis:p，访问次数为:p{rows[0][2]}:sMyEmphasis:p，具体数据可参看下表。")
+        __render_table_with_data(doc, columns, rows)
+
+
+def render_attack_total_by_ips(doc, data):
+    columns, rows = data
+    if len(rows)<=0:
+        doc.add_paragraph("本周暂无攻击数据，您的waf很安全", style='ReportBodyText')
+    else:
+        custom_add_paragraph(doc, f"本周的攻击主要来自:p{rows[0][0]}:sMyEmphasis:p，攻击类型为:p{rows[0][1]}:sMyEmphasis:p，总计攻击:p{rows[0][2]}:sMyEmphasis:p次，具体数据参看下表。")
+        __render_table_with_data(doc, columns, rows)
+
+
+def render_attack_total_by_type(doc, data):
+    columns, rows = data
+    if len(rows)<=0:
+        doc.add_paragraph("本周暂无攻击数据，您的waf很安全", style='ReportBodyText')
+    else:
+        # zip(*rows)一趟拆出两列，免去对行列表的两次遍历
+        labels, counts = zip(*rows)
+        # 数值列提前收敛为int64数组（psycopg2可能返回Decimal），
+        # 百分比用NumPy一次算好，matplotlib不再对每个扇区回调格式化
+        values = np.fromiter(map(int, counts), dtype=np.int64, count=len(counts))
+        pct_labels = iter([f"{p:.2f}%" for p in values * 100.0 / values.sum()])
+        explode = np.full(len(values), 0.01)
+        explode[0] = 0.1
+        # OO接口直连Agg画布，不经过pyplot的全局figure管理器，
+        # 图随局部变量回收，也省掉plt.close()的状态清理
+        fig = Figure(dpi=150)
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        ax.pie(values,
+            labels=labels, # 设置饼图标签
+            explode=explode, # 第二部分突出显示，值越大，距离中心越远
+            autopct=lambda _: next(pct_labels), # 预计算好的百分比标签
+        )
+        ax.set_title("攻击类型统计图")
+        # 图片走内存buffer，省掉PNG写盘再读回的一来一回
+        chart_buf = io.BytesIO()
+        fig.savefig(chart_buf, format='png', bbox_inches='tight')
+        chart_buf.seek(0)
+        p = custom_add_paragraph(doc, f"本周的主要攻击类型为:p{labels[0]}:sMyEmphasis:p，该类型总计攻击:p{values[0]}:sMyEmphasis:p次，具体数据如下图表所示。")
+        run = p.add_run()
+        run.add_picture(chart_buf)
+        __render_table_with_data(doc, columns, rows)
+
+
+
+@functools.lru_cache(maxsize=None)
+def __not_defens_sql():
+    exc_apps = __build_not_in_clause('mdlb.site_uuid', config.except_app_ids)
+    return f"""
+    select
+    mw."comment" as 被攻击应用,
+    mdlb.src_ip as 源IP,
+    mdlb.host as 目标主机,
+    mdlb.url_path as 请求路径,
+    mdlb.dst_port as 目标端口,
+    mdlb.country as 国家代码,
+    mdlb.province as 省份,
+    mdlb.city as 城市,
+    coalesce(at.name, '未知攻击类型') as 攻击类型,
+    mdlb.updated_at as 攻击时间
+    from
+    mgt_detect_log_basic mdlb
+    join mgt_website mw on mdlb.site_uuid::int = mw.id::int
+    left join {__attack_type_values()} on at.code = mdlb.attack_type
+    where
+    mdlb."timestamp" >= %(start_time)s
+    and
+    mdlb."timestamp" <= %(end_time)s
+    and
+    mdlb."action" = 0
+    {exc_apps}
+    """
+
+
+def fetch_not_defens_log(conn):
+    # 明细可能上千行，用命名游标在服务端分批取
+    return __query_stream_from_db(conn.cursor(name='rpt_not_defens'),
+                                  __not_defens_sql(), __report_params())
+
+
+_webdav_client = None
+
+
+def __get_webdav_client():
+    # Client内部持requests.Session，复用实例即复用TCP keep-alive，
+    # 每周上传不再重建会话重新握手
+    global _webdav_client
+    if _webdav_client is None:
+        _webdav_client = Client(config.webdav_options.as_options())
+    return _webdav_client
+
+
+def __fetch_on_pool(pool, fetch):
+    # 供线程池里的取数任务用：借一条连接，取完即还
+    conn = __getconn_checked(pool)
+    try:
+        return fetch(conn)
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+
+
+def render_not_defens_log(doc, cur):
+    first = cur.fetchone()
+    if first is None:
+        cur.close()
+        doc.add_paragraph("本周暂无未拦截攻击，所有攻击都被拒之门外。", style='ReportBodyText')
+        return
+    # 命名游标要取过一次数据后description才可用
+    columns = [desc[0] for desc in cur.description]
+    # 总条数要等流式写完才知道，先占位，表格写完后回填
+    par = doc.add_paragraph("", style='ReportBodyText')
+    table = doc.add_table(1, len(columns))
+    table.style = 'Table Grid'
+    hd_cells = table.rows[0].cells
+    for i in range(len(columns)):
+        hd_cells[i].text = str(columns[i])
+    tbl = table._tbl
+    count = 0
+    row = first
+    while row is not None:
+        __append_table_row(tbl, row)
+        count += 1
+        row = cur.fetchone()
+    cur.close()
+    __render_paragraph_by_template(par, f"本周攻击有:p{count}:sMyEmphasis:p条攻击未被拦截，我们将对其进行分析和拦截处理，具体数据参看下表。")
+
+_template_doc = None
+TEMPLATE_PATH = './template.docx'
+
+
+def init_doc():
+    # 样式模板只构建一次，之后每次报告deepcopy一份，
+    # 免去反复解析default.docx和逐个add_style的XML操作。
+    # 模板同时落盘为template.docx，进程重启后直接载入现成样式，
+    # 不再重放add_style的XML改写（样式是静态的，缓存永远有效）
+    global _template_doc
+    if _template_doc is None:
+        if os.path.exists(TEMPLATE_PATH):
+            _template_doc = Document(TEMPLATE_PATH)
+        else:
+            _template_doc = __build_template_doc()
+            try:
+                _template_doc.save(TEMPLATE_PATH)
+            except Exception:
+                logger.exception("模板缓存写入失败")
+    return copy.deepcopy(_template_doc)
+
+
+def __build_template_doc():
+    doc = Document()
+    styles = doc.styles
+
+    H1 = styles['Heading 1']
+    H1.font.name = '微软雅黑'
+    H1.font.color.rgb = RGBColor(79, 128, 189)
+
+    H2 = styles['Heading 2']
+    H2.font.name = '微软雅黑'
+    H1.font.color.rgb = RGBColor(79, 128, 189)
+
+    if 'ReportHeading1' not in styles:
+        heading_style = styles.add_style('ReportHeading1', 1)
+        heading_style.font.name = '黑体'
+        heading_style.font.size = Pt(16)
+        heading_style.font.bold = True
+        heading_style.font.color.rgb = RGBColor(0, 0, 139)
+        heading_style.paragraph_format.space_before = Pt(12)
+        heading_style.paragraph_format.space_after = Pt(6)
+
+    if 'ReportHeading2' not in styles:
+        heading_style = styles.add_style('ReportHeading2', 1)
+        heading_style.font.name = '黑体'
+        heading_style.font.size = Pt(13)
+        heading_style.font.bold = True
+        heading_style.font.color.rgb = RGBColor(0, 0, 100)
+        heading_style.paragraph_format.space_before = Pt(12)
+        heading_style.paragraph_format.space_after = Pt(6)
+
+    if 'ReportBodyText' not in styles:
+        body_style = styles.add_style('ReportBodyText', 1)
+        body_style.font.name = '宋体'
+        body_style.font.size = Pt(10.5)
+        body_style.paragraph_format.line_spacing = 1.2
+        body_style.paragraph_format.first_line_indent = Pt(21)  # 首行缩进2字符
+    
+    # 预设强调样式（字符样式）
+    if 'MyEmphasis' not in styles:
+        emph_style = styles.add_style('MyEmphasis', 2)  # 2=字符样式
+        emph_style.font.name = '楷体'
+        emph_style.font.italic = True
+        emph_style.font.color.rgb = RGBColor(178, 34, 34)
+    return doc
+
+
+def __render_paragraph(paragraph, texts):
+    for text in texts:
+        run = paragraph.add_run(str(text['value']))
+        try:
+            run.style = text['style']
+        except Exception as e:
+            pass
+            # logger.error("无style值")
+
+def __render_paragraph_by_template(paragraph, tpl):
+    # 直接拼<w:r>挂到段落下，绕开add_run()逐段建Run对象再查样式表的
+    # 开销（与__append_table_row同一套低层写法）
+    par = paragraph._p
+    for seg in str(tpl).split(":p"):
+        # partition单次线性扫描，无样式段不再产生中间list
+        text, _, style = seg.partition(":s")
+        r = OxmlElement('w:r')
+        if style:
+            rPr = OxmlElement('w:rPr')
+            rStyle = OxmlElement('w:rStyle')
+            rStyle.set(qn('w:val'), style)
+            rPr.append(rStyle)
+            r.append(rPr)
+        t = OxmlElement('w:t')
+        t.set(qn('xml:space'), 'preserve')
+        t.text = text
+        r.append(t)
+        par.append(r)
+
+def custom_add_paragraph(doc, tpl):
+    par = doc.add_paragraph("",style='ReportBodyText')
+    __render_paragraph_by_template(par, tpl)
+    return par
+
+
+def main():
+    # 报告周期以本次触发日为基准，在消费方这里统一重算，
+    # 调度循环不再维护这组模块变量
+    global today, start_day, start_time, end_time, end_day
+    today = datetime.date.today()
+    start_day = today-datetime.timedelta(days=7)
+    start_time = __day_start_ts(start_day)
+    end_time = __day_start_ts(today) - 1
+    end_day = str(datetime.datetime.fromtimestamp(end_time))[:10]
+    logger.info("任务触发")
+    logger.debug("%s-%s", start_day, end_day)
+    if not os.path.exists('./report'):
+        os.mkdir('./report')
+    logger.debug("数据库连接信息：%s", config.database_url)
+    pool = __get_db_pool()
+    conn = __getconn_checked(pool)
+    try:
+        # 取数阶段：六条物化查询互不依赖，丢进线程池并行执行，
+        # psycopg2等网络IO时释放GIL，总耗时≈最慢一条而非逐条累加。
+        # 未拦截明细走服务端游标、渲染时才流式消费，留在conn上串行发起
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(__fetch_on_pool, pool, fetch)
+                       for fetch in (fetch_total, fetch_defens_apps,
+                                     fetch_access_total_by_geos,
+                                     fetch_statistics_ips)]
+            not_defens = fetch_not_defens_log(conn)
+            data, defens_apps, access_geos, ips_stats = [f.result() for f in futures]
+            access_ips, attack_ips, attack_types = ips_stats
+
+        # 渲染阶段
+        # doc = Document()
+        doc = init_doc()
+        # doc.add_heading(f"{config.project_name}网络安全巡检报告")
+        doc.add_heading("一、巡检必要性概述", level=1)
+        doc.add_paragraph("本周对Web应用防火墙（WAF）进行了系统性巡检，旨在及时发现并处置潜在的安全威胁，确保Web应用服务的持续可用性和数据安全性。通过定期巡检，可有效识别异常攻击流量、优化防护策略、验证防护效果，并为安全态势评估提供数据支撑，降低因Web应用漏洞导致的数据泄露和服务中断风险。",style='ReportBodyText')
+        doc.add_heading("二、防护应用概览", level=1)
+        if data['未拦截数'] == 0:
+            p = 100
+        else:
+            p = format(data['拦截总数']/(data['拦截总数']+data['未拦截数'])*100, '.2f')
+        # doc.add_paragraph(f"本周waf总体运行平稳，总访问次数为{data['访问总数']}，总拦截次数为{data['拦截总数']}，黑名单拦截次数为{data['黑名单拦截数']}，未拦截攻击次数为{data['未拦截数']}，拦截率为{p}%。")
+        template_p = f"本周waf总体运行平稳，总访问次数为:p{data['访问总数']}:sMyEmphasis:p，总拦截次数为:p{data['拦截总数']}:sMyEmphasis:p，黑名单拦截次数为:p{data['黑名单拦截数']}:sMyEmphasis:p，未拦截攻击次数为:p{data['未拦截数']}:sMyEmphasis:p，拦截率为:p{p}:sMyEmphasis:p %。"
+        custom_add_paragraph(doc, template_p)
+        doc.add_heading("2.1 分应用查看", level=2)
+        render_defens_apps(doc, defens_apps)
+        doc.add_heading("三、访问数据统计", level=1)
+        doc.add_heading("3.1 按地理区域统计访问数据", level=2)
+        render_access_total_by_geos(doc, access_geos)
+        doc.add_heading("3.2 按访问IP统计访问数据TOP10", level=2)
+        render_access_total_by_ips(doc, access_ips)
+        doc.add_heading("四、攻击数据统计", level=1)
+        doc.add_heading("4.1 按攻击方式统计数据", level=2)
+        render_attack_total_by_type(doc, attack_types)
+        doc.add_heading("4.2 按攻击IP统计访问数据TOP10", level=2)
+        render_attack_total_by_ips(doc, attack_ips)
+        doc.add_heading("五、明细数据展示", level=1)
+        doc.add_heading("5.1 未拦截攻击明细", level=2)
+        render_not_defens_log(doc, not_defens)
+
+        doc.add_heading("六、报告信息", level=1)
+        doc.add_paragraph(f"项目名称：{config.project_name}")
+        doc.add_paragraph(f"报告数据统计周期：{start_day}至{end_day}")
+        doc.add_paragraph(f"报告生成时间：{datetime.datetime.now()}")
+        doc.add_paragraph(f"报告审核人：{config.report_onwer}")
+
+        doc_filename = f"{config.project_name}_{start_day}至{end_day}安全运维周报.docx"
+        local_file_path = f'./report/{doc_filename}'
+        doc.save(local_file_path)
+    except Exception:
+        logger.exception("生成报告失败")
+    finally:
+        # 回滚掉只读事务再归还，避免连接带着事务状态回池
+        conn.rollback()
+        pool.putconn(conn)
+
+
+    try:
+        if os.path.exists(local_file_path):
+            client = __get_webdav_client()
+            remote_base_path = f'report/{config.report_onwer}'
+            client.mkdir(remote_base_path)
+            remote_base_path = f'report/{config.report_onwer}/{str(today).replace("-", "")}'
+            client.mkdir(remote_base_path)
+            remote_file_path = f'{remote_base_path}/{doc_filename}'
+            client.upload_sync(remote_path=remote_file_path, local_path=local_file_path)
+        else:
+            logger.error("本地文件不存在，上传失败")
+        logger.info("任务结束")
+    except Exception:
+        logger.exception("上传文件失败")
+
+
+
+
+_log_listener = None
+
+
+def get_logger(name):
+    if not os.path.exists('./logs'):
+        os.mkdir('./logs')
+    logger = logging.getLogger(name)
+    logger.setLevel(config.log_level)
+    
+    # 如果已经配置过，直接返回
+    if logger.handlers:
+        return logger
+    
+    # 设置格式
+    formatter = logging.Formatter(
+        '%(asctime)s [%(levelname)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    
+    # 输出到文件（自动切割）
+    file_handler = logging.handlers.RotatingFileHandler(
+        './logs/app.log',
+        maxBytes=10*10*1024*1024,  # 100MB
+        backupCount=5,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+
+    # 输出到控制台
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    # 异步日志：业务线程emit只是入队，文件/控制台的磁盘与终端IO
+    # 由监听线程在后台消化，DEBUG级整段SQL也不会卡住取数线程
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    global _log_listener
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler)
+    _log_listener.start()
+    # 监听线程是daemon，退出前stop()把队列里攒着的记录冲掉，
+    # -now短进程的收尾日志才不会丢
+    atexit.register(_log_listener.stop)
+
+    return logger
+
+
+if __name__ == '__main__':
+    logger = get_logger(__name__)
+
+    if __setup_matplotlib_font():
+        logger.info("字体加载OK")
+    else:
+        logger.debug("使用回退字体: DejaVu Sans")
+
+    if len(sys.argv) == 2 and sys.argv[1] == '-now':
+        logger.debug("立即执行生成报告")
+        main()
+        sys.exit(0)
+
+    RUN_AT = datetime.time(12, 0)
+
+    while True:
+        # 直接睡到下一个触发点，不再每3秒醒来轮询
+        now = datetime.datetime.now()
+        next_run = datetime.datetime.combine(now.date(), RUN_AT)
+        if next_run <= now:
+            next_run += datetime.timedelta(days=1)
+        logger.info("下次任务时间：%s", next_run)
+        time.sleep(max(1.0, (next_run - datetime.datetime.now()).total_seconds()))
+        main()
\ No newline at end of file